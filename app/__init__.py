@@ -3,7 +3,8 @@ from flask_cors import CORS
 from .config import Config
 from .models import db
 from .schemas import ma
-from .routes import auth_bp, users_bp, roles_bp, books_bp, clientes_bp, prestamos_bp, reportes_bp
+from .ratelimit import limiter
+from .routes import auth_bp, users_bp, roles_bp, books_bp, sucursales_bp, clientes_bp, prestamos_bp, reportes_bp, reservas_bp, eventos_bp
 
 def create_app():
     app = Flask(__name__)
@@ -13,13 +14,17 @@ def create_app():
     
     db.init_app(app)
     ma.init_app(app)
+    limiter.init_app(app)
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(users_bp)
     app.register_blueprint(roles_bp)
     app.register_blueprint(books_bp)
+    app.register_blueprint(sucursales_bp)
     app.register_blueprint(clientes_bp)
     app.register_blueprint(prestamos_bp)
     app.register_blueprint(reportes_bp)
+    app.register_blueprint(reservas_bp)
+    app.register_blueprint(eventos_bp)
     
     return app
\ No newline at end of file
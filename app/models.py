@@ -47,6 +47,37 @@ class Book(db.Model):
     def __repr__(self):
         return f"<Libro {self.id}: {self.titulo}>"
     
+# ---------- Tabla de sucursales -------------------
+class Sucursal(db.Model):
+    __tablename__ = "sucursales"
+    
+    id         = db.Column(db.Integer, primary_key=True)
+    nombre     = db.Column(db.String(100), unique=True, nullable=False)
+    direccion  = db.Column(db.String(255))
+    created_at = db.Column(db.TIMESTAMP, server_default=db.func.current_timestamp())
+    
+    def __repr__(self):
+        return f"<Sucursal {self.id}: {self.nombre}>"
+    
+# ---------- Tabla de ejemplares por sucursal -------------------
+class Ejemplar(db.Model):
+    __tablename__ = "ejemplares"
+    __table_args__ = (
+        db.UniqueConstraint("libro_id", "sucursal_id", name="uq_ejemplares_libro_sucursal"),
+        db.Index("ix_ejemplares_sucursal_libro", "sucursal_id", "libro_id"),
+    )
+    
+    id          = db.Column(db.Integer, primary_key=True)
+    libro_id    = db.Column(db.Integer, db.ForeignKey("libros.id"), nullable=False)
+    sucursal_id = db.Column(db.Integer, db.ForeignKey("sucursales.id"), nullable=False)
+    cantidad    = db.Column(db.Integer, nullable=False, default=0)
+    
+    libro = db.relationship("Book", backref="ejemplares")
+    sucursal = db.relationship("Sucursal", backref="ejemplares")
+    
+    def __repr__(self):
+        return f"<Ejemplar Libro {self.libro_id} - Sucursal {self.sucursal_id}: {self.cantidad}>"
+    
 # ---------- Tabla de clientes -------------------
 class Cliente(db.Model):
     __tablename__ = "clientes"
@@ -65,11 +96,16 @@ class Cliente(db.Model):
 # ---------- Tabla de prestamos -------------------
 class Prestamo(db.Model):
     __tablename__ = "prestamos"
+    __table_args__ = (
+        db.Index("ix_prestamos_cliente_fecha", "cliente_id", "fecha_prestamo"),
+        db.Index("ix_prestamos_sucursal_estado", "sucursal_id", "estado", "libro_id"),
+    )
     
     id                        = db.Column(db.Integer, primary_key=True)
     libro_id                  = db.Column(db.Integer, db.ForeignKey("libros.id"), nullable=False)
     cliente_id                = db.Column(db.Integer, db.ForeignKey("clientes.id"), nullable=False)
     usuario_id                = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    sucursal_id               = db.Column(db.Integer, db.ForeignKey("sucursales.id"))
     fecha_prestamo            = db.Column(db.TIMESTAMP, server_default=db.func.current_timestamp())
     fecha_devolucion_esperada = db.Column(db.TIMESTAMP, nullable=False)
     fecha_devolucion_real     = db.Column(db.TIMESTAMP)
@@ -80,4 +116,40 @@ class Prestamo(db.Model):
     usuario = db.relationship("User", backref="prestamos_registrados")
     
     def __repr__(self):
-        return f"<Prestamo {self.id}: Libro {self.libro_id} - Cliente {self.cliente_id}>"
\ No newline at end of file
+        return f"<Prestamo {self.id}: Libro {self.libro_id} - Cliente {self.cliente_id}>"
+    
+# ---------- Tabla de reservas -------------------
+class Reserva(db.Model):
+    __tablename__ = "reservas"
+    __table_args__ = (
+        db.Index("ix_reservas_libro_estado", "libro_id", "estado", "id"),
+    )
+    
+    id               = db.Column(db.Integer, primary_key=True)
+    libro_id         = db.Column(db.Integer, db.ForeignKey("libros.id"), nullable=False)
+    cliente_id       = db.Column(db.Integer, db.ForeignKey("clientes.id"), nullable=False)
+    usuario_id       = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    sucursal_id      = db.Column(db.Integer, db.ForeignKey("sucursales.id"))
+    estado           = db.Column(db.String(20), nullable=False, default="pendiente")
+    fecha_asignacion = db.Column(db.TIMESTAMP)
+    created_at       = db.Column(db.TIMESTAMP, server_default=db.func.current_timestamp())
+    
+    libro = db.relationship("Book", backref="reservas")
+    cliente = db.relationship("Cliente", backref="reservas")
+    
+    def __repr__(self):
+        return f"<Reserva {self.id}: Libro {self.libro_id} - Cliente {self.cliente_id}>"
+    
+# ---------- Tabla de eventos (outbox) -------------------
+class Evento(db.Model):
+    __tablename__ = "eventos"
+    
+    id         = db.Column(db.Integer, primary_key=True)
+    entidad    = db.Column(db.String(20), nullable=False)
+    entidad_id = db.Column(db.Integer, nullable=False)
+    accion     = db.Column(db.String(20), nullable=False)
+    datos      = db.Column(db.JSON)
+    created_at = db.Column(db.TIMESTAMP, server_default=db.func.current_timestamp())
+    
+    def __repr__(self):
+        return f"<Evento {self.id}: {self.entidad} {self.entidad_id} {self.accion}>"
\ No newline at end of file
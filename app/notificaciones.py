@@ -0,0 +1,16 @@
+# -------- Hooks de notificación --------
+# Se invocan después de confirmar la transacción; un fallo en un hook no
+# revierte la operación que lo originó.
+_hooks_reserva_asignada = []
+
+def on_reserva_asignada(f):
+    """Registra una función que recibe cada reserva a la que se asignó un ejemplar"""
+    _hooks_reserva_asignada.append(f)
+    return f
+
+def notificar_reserva_asignada(reserva):
+    for hook in _hooks_reserva_asignada:
+        try:
+            hook(reserva)
+        except Exception as e:
+            print(f"Error en notificación de reserva {reserva.id}: {str(e)}")
@@ -0,0 +1,103 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from flask import request, jsonify
+
+class MemoryBackend:
+    """Cubetas de tokens en memoria del proceso, protegidas por un candado.
+    
+    Al superar `max_keys` se descarta la cubeta usada hace más tiempo (LRU).
+    """
+    
+    def __init__(self, max_keys=10000):
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self._max_keys = max_keys
+    
+    def consume(self, key, capacidad, periodo):
+        """Consume un token de `key`; devuelve los segundos de espera (0 si se permite)"""
+        tasa = capacidad / periodo
+        now = time.monotonic()
+        
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self._max_keys:
+                    self._buckets.popitem(last=False)
+                tokens = float(capacidad)
+            else:
+                tokens = min(capacidad, bucket[0] + (now - bucket[1]) * tasa)
+                self._buckets.move_to_end(key)
+            
+            espera = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                espera = (1 - tokens) / tasa
+            
+            # [tokens, última actualización]
+            self._buckets[key] = [tokens, now]
+            return espera
+
+class RateLimiter:
+    """Limita solicitudes por cliente según reglas por endpoint o blueprint.
+    
+    Cada solicitud consume siempre de la cubeta de su IP. `X-User-ID` no está
+    autenticado, así que solo añade una cubeta por usuario encima de la de la IP
+    y se ignora en las reglas de RATELIMIT_SOLO_IP (p. ej. el login).
+    
+    `backend` puede ser cualquier objeto con `consume(key, capacidad, periodo)`
+    que devuelva los segundos de espera, p. ej. uno respaldado por Redis para
+    compartir los límites entre varios procesos.
+    """
+    
+    def __init__(self, app=None, backend=None):
+        self.backend = backend or MemoryBackend()
+        self.limits = {}
+        self.solo_ip = set()
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.limits = dict(app.config.get('RATELIMIT_LIMITS', {}))
+        self.solo_ip = set(app.config.get('RATELIMIT_SOLO_IP', ['auth.login']))
+        if app.config.get('RATELIMIT_ENABLED', True) and self.limits:
+            app.before_request(self.check)
+        app.extensions['ratelimit'] = self
+    
+    def get_rule(self, endpoint, blueprint):
+        if endpoint in self.limits:
+            return endpoint, self.limits[endpoint]
+        if blueprint in self.limits:
+            return blueprint, self.limits[blueprint]
+        return None, None
+    
+    def check(self):
+        if request.method == 'OPTIONS':
+            return None
+        
+        regla, limite = self.get_rule(request.endpoint, request.blueprint)
+        if limite is None:
+            return None
+        
+        capacidad, periodo = limite
+        espera = self.backend.consume(f"{regla}:ip{request.remote_addr}", capacidad, periodo)
+        
+        user_id = request.headers.get('X-User-ID')
+        if user_id and regla not in self.solo_ip:
+            espera = max(espera, self.backend.consume(f"{regla}:u{user_id}", capacidad, periodo))
+        
+        if not espera:
+            return None
+        
+        retry_after = max(1, math.ceil(espera))
+        response = jsonify({
+            'message': 'Demasiadas solicitudes, intente más tarde',
+            'retry_after': retry_after
+        })
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+limiter = RateLimiter()
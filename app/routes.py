@@ -1,14 +1,21 @@
-from flask import Blueprint, request, jsonify
-from .models import db, User, Role, Book, Cliente, Prestamo
+from flask import Blueprint, request, jsonify, current_app
+from .models import db, User, Role, Book, Sucursal, Ejemplar, Cliente, Prestamo, Reserva, Evento
+from .notificaciones import notificar_reserva_asignada
 from functools import wraps
 from datetime import datetime, timedelta
 import re
+import time
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 from .schemas import (
     user_schema, users_schema, user_login_schema,
     role_schema, roles_schema,
     book_schema, books_schema,
+    sucursal_schema, sucursales_schema,
     cliente_schema, clientes_schema,
-    prestamo_schema, prestamos_schema
+    prestamo_schema, prestamos_schema,
+    reserva_schema, reservas_schema,
+    eventos_schema
 )
 
 #----Blueprints-----------
@@ -16,9 +23,12 @@ auth_bp = Blueprint("auth", __name__, url_prefix="/auth")
 users_bp = Blueprint("users", __name__, url_prefix="/users")
 roles_bp = Blueprint("roles", __name__, url_prefix="/roles")
 books_bp = Blueprint("books", __name__, url_prefix="/libros")
+sucursales_bp = Blueprint("sucursales", __name__, url_prefix="/sucursales")
 clientes_bp = Blueprint("clientes", __name__, url_prefix="/clientes")
 prestamos_bp = Blueprint("prestamos", __name__, url_prefix="/prestamos")
 reportes_bp = Blueprint("reportes", __name__, url_prefix="/reportes")
+reservas_bp = Blueprint("reservas", __name__, url_prefix="/reservas")
+eventos_bp = Blueprint("eventos", __name__, url_prefix="/eventos")
 
 # -------- Rutas de Autenticación --------
 @auth_bp.route("/login", methods=["POST"])
@@ -78,18 +88,240 @@ def manager_or_admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-def get_real_availability(libro_id):
-    """Calcula la disponibilidad real de un libro basada en préstamos activos"""
-    libro = Book.query.get(libro_id)
-    if not libro:
+def bloquear_inventario(libro_id, sucursal_id=None):
+    """Bloquea hasta el commit la fila con los ejemplares de un libro o de una sucursal.
+    
+    Toda operación que cambie la disponibilidad debe tomarlo antes de contar préstamos
+    y reservas. El orden es siempre libro y luego ejemplar; en una sucursal el libro se
+    bloquea en modo compartido. Los conteos posteriores son lecturas sin bloqueo: en
+    READ COMMITTED ven lo último confirmado, y las filas bloqueadas ya serializan a
+    quienes los modifican sin tomar bloqueos de rango sobre préstamos y reservas.
+    """
+    if sucursal_id is None:
+        return Book.query.filter_by(id=libro_id).with_for_update().populate_existing().first()
+    
+    Book.query.filter_by(id=libro_id).with_for_update(read=True).first()
+    return Ejemplar.query.filter_by(
+        libro_id=libro_id,
+        sucursal_id=sucursal_id
+    ).with_for_update().populate_existing().first()
+
+def contar_ocupados(**filtros):
+    """Cuenta préstamos activos más reservas asignadas que cumplen `filtros`"""
+    total = 0
+    for modelo, estado in ((Prestamo, 'activo'), (Reserva, 'asignada')):
+        total += db.session.query(db.func.count(modelo.id)).filter(
+            modelo.estado == estado,
+            *[getattr(modelo, campo) == valor for campo, valor in filtros.items()]
+        ).scalar()
+    return total
+
+def get_real_availability(libro_id, sucursal_id=None, bloquear=False):
+    """Calcula la disponibilidad real de un libro basada en préstamos activos y reservas asignadas.
+    
+    Con `sucursal_id` cuenta los ejemplares, préstamos y reservas de esa sucursal. Los
+    préstamos y reservas sin sucursal (anteriores a los ejemplares por sucursal) pueden
+    ocupar un ejemplar de cualquier sucursal, así que se descuentan de todas. Con
+    `bloquear` toma antes `bloquear_inventario`.
+    """
+    if bloquear:
+        fila = bloquear_inventario(libro_id, sucursal_id)
+    elif sucursal_id is None:
+        fila = Book.query.get(libro_id)
+    else:
+        fila = Ejemplar.query.filter_by(libro_id=libro_id, sucursal_id=sucursal_id).first()
+    
+    if not fila:
         return 0
     
-    prestamos_activos = Prestamo.query.filter_by(
+    if sucursal_id is None:
+        return max(0, fila.cantidad_disponible - contar_ocupados(libro_id=libro_id))
+    
+    ocupados = contar_ocupados(libro_id=libro_id, sucursal_id=sucursal_id)
+    sin_sucursal = contar_ocupados(libro_id=libro_id, sucursal_id=None)
+    return max(0, fila.cantidad - ocupados - sin_sucursal)
+
+def get_branch_availability(sucursal_id=None, libro_id=None):
+    """Disponibilidad por (libro, sucursal) en una sola consulta agrupada.
+    
+    Devuelve tuplas (ejemplar, disponibles); filtra por sucursal, por libro o ambos.
+    Igual que `get_real_availability`, descuenta de cada sucursal los préstamos y
+    reservas sin sucursal del mismo libro.
+    """
+    agregados = []
+    for modelo, estado in ((Prestamo, 'activo'), (Reserva, 'asignada')):
+        por_sucursal = db.session.query(
+            modelo.libro_id,
+            modelo.sucursal_id,
+            db.func.count(modelo.id).label('total')
+        ).filter(modelo.estado == estado, modelo.sucursal_id.isnot(None))
+        
+        sin_sucursal = db.session.query(
+            modelo.libro_id,
+            db.func.count(modelo.id).label('total')
+        ).filter(modelo.estado == estado, modelo.sucursal_id.is_(None))
+        
+        if sucursal_id is not None:
+            por_sucursal = por_sucursal.filter(modelo.sucursal_id == sucursal_id)
+        
+        if libro_id is not None:
+            por_sucursal = por_sucursal.filter(modelo.libro_id == libro_id)
+            sin_sucursal = sin_sucursal.filter(modelo.libro_id == libro_id)
+        
+        agregados.append((
+            por_sucursal.group_by(modelo.libro_id, modelo.sucursal_id).subquery(),
+            sin_sucursal.group_by(modelo.libro_id).subquery()
+        ))
+    
+    query = Ejemplar.query.options(db.joinedload(Ejemplar.libro))
+    
+    if sucursal_id is not None:
+        query = query.filter(Ejemplar.sucursal_id == sucursal_id)
+        
+    if libro_id is not None:
+        query = query.filter(Ejemplar.libro_id == libro_id)
+    
+    ocupados = []
+    for por_sucursal, sin_sucursal in agregados:
+        query = query.outerjoin(por_sucursal, db.and_(
+            por_sucursal.c.libro_id == Ejemplar.libro_id,
+            por_sucursal.c.sucursal_id == Ejemplar.sucursal_id
+        )).outerjoin(sin_sucursal, sin_sucursal.c.libro_id == Ejemplar.libro_id)
+        ocupados.append(db.func.coalesce(por_sucursal.c.total, 0))
+        ocupados.append(db.func.coalesce(sin_sucursal.c.total, 0))
+    
+    filas = query.add_columns(*ocupados).order_by(Ejemplar.libro_id, Ejemplar.sucursal_id).all()
+    
+    return [
+        (ejemplar, max(0, ejemplar.cantidad - sum(conteos)))
+        for ejemplar, *conteos in filas
+    ]
+
+def get_books_availability():
+    """Disponibilidad real de todos los libros en una sola consulta agrupada.
+    
+    Devuelve tuplas (libro, disponibles) con el mismo cálculo que `get_real_availability`
+    sin sucursal.
+    """
+    query = Book.query
+    ocupados = []
+    for modelo, estado in ((Prestamo, 'activo'), (Reserva, 'asignada')):
+        agregado = db.session.query(
+            modelo.libro_id,
+            db.func.count(modelo.id).label('total')
+        ).filter(modelo.estado == estado).group_by(modelo.libro_id).subquery()
+        
+        query = query.outerjoin(agregado, agregado.c.libro_id == Book.id)
+        ocupados.append(db.func.coalesce(agregado.c.total, 0))
+    
+    filas = query.add_columns(*ocupados).order_by(Book.id).all()
+    
+    return [
+        (libro, max(0, libro.cantidad_disponible - sum(conteos)))
+        for libro, *conteos in filas
+    ]
+
+def registrar_evento(entidad, entidad_id, accion, datos=None):
+    """Registra un evento de cambio; se inserta y confirma junto con el cambio que lo origina"""
+    evento = Evento(
+        entidad=entidad,
+        entidad_id=entidad_id,
+        accion=accion,
+        datos=datos
+    )
+    # Sin transacción abierta, un rollback no descartaría los eventos pendientes
+    sesion = db.session()
+    if not sesion.in_transaction():
+        sesion.begin()
+    sesion.info.setdefault('eventos_pendientes', []).append(evento)
+    return evento
+
+@event.listens_for(Session, "before_commit")
+def insertar_eventos_pendientes(session):
+    # El id del evento se asigna al insertar. Insertarlo como última sentencia, después de
+    # que el resto de la transacción ya obtuvo sus bloqueos, deja el hueco visible en
+    # /eventos abierto solo durante el commit.
+    eventos = session.info.pop('eventos_pendientes', None)
+    if eventos:
+        session.flush()
+        session.add_all(eventos)
+        session.flush()
+
+@event.listens_for(Session, "after_soft_rollback")
+def descartar_eventos_pendientes(session, previous_transaction):
+    session.info.pop('eventos_pendientes', None)
+
+def vencer_reservas(libro_id, sucursal_id=None):
+    """Marca como vencidas las reservas asignadas que no se retiraron dentro del plazo"""
+    limite = datetime.now() - timedelta(days=current_app.config.get('RESERVA_DIAS_RETIRO', 3))
+    
+    reservas = Reserva.query.filter(
+        Reserva.libro_id == libro_id,
+        Reserva.sucursal_id == sucursal_id,
+        Reserva.estado == 'asignada',
+        Reserva.fecha_asignacion < limite
+    ).with_for_update().all()
+    
+    for reserva in reservas:
+        reserva.estado = 'vencida'
+        registrar_evento('reserva', reserva.id, 'vencida', {
+            'libro_id': reserva.libro_id,
+            'cliente_id': reserva.cliente_id,
+            'sucursal_id': reserva.sucursal_id
+        })
+    
+    return reservas
+
+def asignar_reservas(libro_id, sucursal_id=None):
+    """Asigna los ejemplares libres de un libro a las reservas pendientes en orden de llegada.
+    
+    Antes libera las reservas asignadas cuyo plazo de retiro venció. Sin `sucursal_id`,
+    si el libro ya tiene ejemplares por sucursal, lo liberado cuenta en todas ellas y se
+    asigna en cada una. No confirma la transacción; devuelve las reservas asignadas para
+    `confirmar_asignaciones`.
+    """
+    bloquear_inventario(libro_id, sucursal_id)
+    
+    if sucursal_id is None:
+        sucursales = [
+            ejemplar.sucursal_id
+            for ejemplar in Ejemplar.query.filter_by(libro_id=libro_id).order_by(Ejemplar.sucursal_id)
+        ]
+        if sucursales:
+            return [
+                reserva
+                for sucursal in sucursales
+                for reserva in asignar_reservas(libro_id, sucursal)
+            ]
+    vencer_reservas(libro_id, sucursal_id)
+    
+    libres = get_real_availability(libro_id, sucursal_id, bloquear=True)
+    if libres < 1:
+        return []
+    
+    reservas = Reserva.query.filter_by(
         libro_id=libro_id,
-        estado='activo'
-    ).count()
+        sucursal_id=sucursal_id,
+        estado='pendiente'
+    ).order_by(Reserva.id).limit(libres).with_for_update().all()
+    
+    for reserva in reservas:
+        reserva.estado = 'asignada'
+        reserva.fecha_asignacion = datetime.now()
+        registrar_evento('reserva', reserva.id, 'asignada', {
+            'libro_id': reserva.libro_id,
+            'cliente_id': reserva.cliente_id,
+            'sucursal_id': reserva.sucursal_id
+        })
+    
+    return reservas
+
+def confirmar_asignaciones(asignadas):
+    """Confirma la transacción y notifica las reservas asignadas en ella"""
+    db.session.commit()
     
-    return max(0, libro.cantidad_disponible - prestamos_activos)
+    for reserva in asignadas:
+        notificar_reserva_asignada(reserva)
 
 # -------- Rutas de Usuarios --------
 @users_bp.route("/", methods=["POST"])
@@ -188,6 +420,11 @@ def add_book():
         
         new_book = book_schema.load(data)
         db.session.add(new_book)
+        db.session.flush()
+        registrar_evento('libro', new_book.id, 'creado', {
+            'isbn': new_book.isbn,
+            'cantidad_disponible': new_book.cantidad_disponible
+        })
         db.session.commit()
         return book_schema.dump(new_book), 201
         
@@ -196,13 +433,23 @@ def add_book():
     
 @books_bp.route("/", methods=["GET"])
 def get_books():
-    """Devuelve libros con disponibilidad real calculada"""
-    libros = Book.query.all()
+    """Devuelve libros con disponibilidad real calculada; con `sucursal` solo los de esa sucursal"""
+    sucursal_id = request.args.get('sucursal', type=int)
+    if sucursal_id:
+        libros_data = []
+        for ejemplar, disponibles in get_branch_availability(sucursal_id=sucursal_id):
+            libro_dict = book_schema.dump(ejemplar.libro)
+            libro_dict['sucursal_id'] = sucursal_id
+            libro_dict['ejemplares'] = ejemplar.cantidad
+            libro_dict['disponibilidad_real'] = disponibles
+            libros_data.append(libro_dict)
+        
+        return jsonify(libros_data), 200
+    
     libros_data = []
     
-    for libro in libros:
+    for libro, disponibilidad_real in get_books_availability():
         libro_dict = book_schema.dump(libro)
-        disponibilidad_real = get_real_availability(libro.id)
         libro_dict['disponibilidad_real'] = disponibilidad_real
         libros_data.append(libro_dict)
     
@@ -214,8 +461,96 @@ def get_book(book_id):
     book = Book.query.get_or_404(book_id)
     book_data = book_schema.dump(book)
     book_data['disponibilidad_real'] = get_real_availability(book_id)
+    book_data['sucursales'] = [
+        {
+            'sucursal_id': ejemplar.sucursal_id,
+            'ejemplares': ejemplar.cantidad,
+            'disponibilidad_real': disponibles
+        }
+        for ejemplar, disponibles in get_branch_availability(libro_id=book_id)
+    ]
     return book_data, 200
 
+@books_bp.route("/<int:book_id>/ejemplares", methods=["PUT"])
+@manager_or_admin_required
+def update_ejemplares(book_id):
+    """Fija la cantidad de ejemplares de un libro en una sucursal; el total del libro es la suma por sucursal"""
+    data = request.get_json()
+    book = Book.query.get_or_404(book_id)
+    sucursal = Sucursal.query.get_or_404(data.get('sucursal_id'))
+    
+    try:
+        cantidad = data.get('cantidad')
+        if cantidad is None or cantidad < 0:
+            return jsonify({'message': 'La cantidad de ejemplares no puede ser negativa'}), 400
+        
+        # Cambia el total del libro: bloqueo exclusivo del libro y luego de la sucursal
+        bloquear_inventario(book.id)
+        ejemplar = bloquear_inventario(book.id, sucursal.id)
+        
+        ocupados = contar_ocupados(libro_id=book.id, sucursal_id=sucursal.id)
+        
+        if cantidad < ocupados:
+            return jsonify({
+                'message': f'No se puede reducir la cantidad a {cantidad}. Hay {ocupados} ejemplares prestados o apartados en esta sucursal.'
+            }), 400
+        
+        nuevo_total = cantidad + db.session.query(
+            db.func.coalesce(db.func.sum(Ejemplar.cantidad), 0)
+        ).filter(
+            Ejemplar.libro_id == book.id,
+            Ejemplar.sucursal_id != sucursal.id
+        ).scalar()
+        
+        ocupados_libro = contar_ocupados(libro_id=book.id)
+        
+        if nuevo_total < ocupados_libro:
+            return jsonify({
+                'message': f'No se puede reducir el total del libro a {nuevo_total}. Hay {ocupados_libro} ejemplares prestados o apartados en todas las sucursales.'
+            }), 400
+        
+        if not ejemplar:
+            # La primera sucursal del libro recibe sus reservas sin sucursal, que ya no
+            # se atenderían: las devoluciones y préstamos pasan a ser por sucursal
+            if not Ejemplar.query.filter_by(libro_id=book.id).first():
+                for reserva in Reserva.query.filter(
+                    Reserva.libro_id == book.id,
+                    Reserva.sucursal_id.is_(None),
+                    Reserva.estado.in_(['pendiente', 'asignada'])
+                ).order_by(Reserva.id).with_for_update():
+                    reserva.sucursal_id = sucursal.id
+                    registrar_evento('reserva', reserva.id, 'trasladada', {
+                        'libro_id': reserva.libro_id,
+                        'cliente_id': reserva.cliente_id,
+                        'sucursal_id': reserva.sucursal_id
+                    })
+            
+            ejemplar = Ejemplar(libro_id=book.id, sucursal_id=sucursal.id)
+            db.session.add(ejemplar)
+        ejemplar.cantidad = cantidad
+        book.cantidad_disponible = nuevo_total
+        
+        registrar_evento('libro', book.id, 'ejemplares', {
+            'sucursal_id': sucursal.id,
+            'cantidad': cantidad,
+            'cantidad_disponible': book.cantidad_disponible
+        })
+        
+        asignadas = asignar_reservas(book.id, sucursal.id)
+        confirmar_asignaciones(asignadas)
+        
+        return jsonify({
+            'libro_id': book.id,
+            'sucursal_id': sucursal.id,
+            'ejemplares': ejemplar.cantidad,
+            'cantidad_disponible': book.cantidad_disponible,
+            'disponibilidad_real': get_real_availability(book.id, sucursal.id)
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': 'Error al actualizar ejemplares', 'error': str(e)}), 500
+
 @books_bp.route("/<int:book_id>", methods=["DELETE"])
 @manager_or_admin_required
 def delete_book(book_id):
@@ -265,7 +600,18 @@ def delete_book(book_id):
                 'prestamos_activos': verificacion_final
             }), 400
         
+        for reserva in Reserva.query.filter_by(libro_id=libro.id).all():
+            if reserva.estado in ['pendiente', 'asignada']:
+                registrar_evento('reserva', reserva.id, 'cancelada', {
+                    'libro_id': reserva.libro_id,
+                    'cliente_id': reserva.cliente_id,
+                    'sucursal_id': reserva.sucursal_id
+                })
+            db.session.delete(reserva)
+        Ejemplar.query.filter_by(libro_id=libro.id).delete()
+        
         print("Eliminando libro...")
+        registrar_evento('libro', libro.id, 'eliminado')
         db.session.delete(libro)
         db.session.commit()
         print("Libro eliminado exitosamente")
@@ -297,14 +643,18 @@ def update_book(book_id):
             if nueva_cantidad < 0:
                 return jsonify({'message': 'La cantidad disponible no puede ser negativa'}), 400
             
-            prestamos_activos = Prestamo.query.filter_by(
-                libro_id=book_id,
-                estado='activo'
-            ).count()
+            bloquear_inventario(book_id)
+            
+            if Ejemplar.query.filter_by(libro_id=book_id).first():
+                return jsonify({
+                    'message': 'Este libro tiene ejemplares por sucursal; actualice la cantidad en /libros/<id>/ejemplares'
+                }), 400
+            
+            ocupados = contar_ocupados(libro_id=book_id)
             
-            if nueva_cantidad < prestamos_activos:
+            if nueva_cantidad < ocupados:
                 return jsonify({
-                    'message': f'No se puede reducir la cantidad a {nueva_cantidad}. Hay {prestamos_activos} préstamos activos de este libro.'
+                    'message': f'No se puede reducir la cantidad a {nueva_cantidad}. Hay {ocupados} ejemplares prestados o apartados para reservas.'
                 }), 400
                 
         if 'titulo' in data:
@@ -325,13 +675,50 @@ def update_book(book_id):
         if 'cantidad_disponible' in data:
             book.cantidad_disponible = data['cantidad_disponible']
         
-        db.session.commit()
+        campos = ['titulo', 'autor', 'editorial', 'anio_publicacion', 'isbn', 'cantidad_disponible']
+        registrar_evento('libro', book.id, 'actualizado', {
+            campo: data[campo] for campo in campos if campo in data
+        })
+        
+        asignadas = asignar_reservas(book.id) if 'cantidad_disponible' in data else []
+        confirmar_asignaciones(asignadas)
+        
         return book_schema.dump(book), 200
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': 'Error al actualizar libro', 'error': str(e)}), 500
 
+# -------- Rutas de Sucursales --------
+@sucursales_bp.route("/", methods=["POST"])
+@admin_required
+def add_sucursal():
+    try:
+        data = request.get_json()
+        
+        if not data.get('nombre'):
+            return jsonify({'message': 'El nombre de la sucursal es requerido'}), 400
+            
+        if Sucursal.query.filter_by(nombre=data.get('nombre')).first():
+            return jsonify({'message': 'Ya existe una sucursal con este nombre'}), 400
+        
+        new_sucursal = sucursal_schema.load(data)
+        db.session.add(new_sucursal)
+        db.session.commit()
+        return sucursal_schema.dump(new_sucursal), 201
+        
+    except Exception as e:
+        return jsonify({'message': 'Error al crear sucursal', 'error': str(e)}), 500
+
+@sucursales_bp.route("/", methods=["GET"])
+def get_sucursales():
+    return sucursales_schema.dump(Sucursal.query.all()), 200
+
+@sucursales_bp.route("/<int:sucursal_id>", methods=["GET"])
+def get_sucursal(sucursal_id):
+    sucursal = Sucursal.query.get_or_404(sucursal_id)
+    return sucursal_schema.dump(sucursal), 200
+
 # -------- Rutas de Clientes --------
 @clientes_bp.route("/", methods=["POST"])
 @manager_or_admin_required
@@ -368,6 +755,80 @@ def get_cliente(cliente_id):
     cliente = Cliente.query.get_or_404(cliente_id)
     return cliente_schema.dump(cliente), 200
 
+@clientes_bp.route("/<int:cliente_id>/prestamos", methods=["GET"])
+def get_prestamos_cliente(cliente_id):
+    """Historial de préstamos de un cliente, paginado por cursor (fecha_prestamo, id) descendente"""
+    Cliente.query.get_or_404(cliente_id)
+    
+    try:
+        estado = request.args.get('estado', '')
+        cursor = request.args.get('cursor', '')
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+        
+        query = Prestamo.query.options(
+            db.joinedload(Prestamo.libro)
+        ).filter(Prestamo.cliente_id == cliente_id)
+        
+        if estado:
+            query = query.filter(Prestamo.estado == estado)
+        
+        if cursor:
+            try:
+                fecha_str, id_str = cursor.split('_')
+                fecha_cursor = datetime.fromisoformat(fecha_str)
+                id_cursor = int(id_str)
+            except ValueError:
+                return jsonify({'message': 'Cursor inválido'}), 400
+            
+            query = query.filter(db.or_(
+                Prestamo.fecha_prestamo < fecha_cursor,
+                db.and_(Prestamo.fecha_prestamo == fecha_cursor, Prestamo.id < id_cursor)
+            ))
+        
+        prestamos = query.order_by(
+            Prestamo.fecha_prestamo.desc(),
+            Prestamo.id.desc()
+        ).limit(limit + 1).all()
+        
+        siguiente = None
+        if len(prestamos) > limit:
+            prestamos = prestamos[:limit]
+            ultimo = prestamos[-1]
+            siguiente = f"{ultimo.fecha_prestamo.isoformat()}_{ultimo.id}"
+        
+        return jsonify({
+            'prestamos': prestamos_schema.dump(prestamos),
+            'siguiente': siguiente
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'message': 'Error al obtener préstamos del cliente', 'error': str(e)}), 500
+
+@clientes_bp.route("/<int:cliente_id>/resumen", methods=["GET"])
+def get_resumen_cliente(cliente_id):
+    """Conteos de préstamos activos, devueltos y vencidos de un cliente en una sola consulta"""
+    Cliente.query.get_or_404(cliente_id)
+    
+    try:
+        activos, devueltos, vencidos = db.session.query(
+            db.func.count(db.case((Prestamo.estado == 'activo', 1))),
+            db.func.count(db.case((Prestamo.estado == 'devuelto', 1))),
+            db.func.count(db.case((db.and_(
+                Prestamo.estado == 'activo',
+                Prestamo.fecha_devolucion_esperada < datetime.now()
+            ), 1)))
+        ).filter(Prestamo.cliente_id == cliente_id).one()
+        
+        return jsonify({
+            'cliente_id': cliente_id,
+            'activos': activos,
+            'devueltos': devueltos,
+            'vencidos': vencidos
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'message': 'Error al obtener resumen del cliente', 'error': str(e)}), 500
+
 @clientes_bp.route("/<int:cliente_id>", methods=["DELETE"])
 @manager_or_admin_required
 def delete_cliente(cliente_id):
@@ -400,9 +861,28 @@ def delete_cliente(cliente_id):
             for prestamo in prestamos_historicos:
                 db.session.delete(prestamo)
         
+        reservas = Reserva.query.filter_by(cliente_id=cliente.id).all()
+        libros_liberados = {(r.libro_id, r.sucursal_id) for r in reservas if r.estado == 'asignada'}
+        for libro_id, sucursal_id in sorted(libros_liberados, key=lambda clave: (clave[0], clave[1] or 0)):
+            bloquear_inventario(libro_id, sucursal_id)
+        for reserva in reservas:
+            if reserva.estado in ['pendiente', 'asignada']:
+                registrar_evento('reserva', reserva.id, 'cancelada', {
+                    'libro_id': reserva.libro_id,
+                    'cliente_id': reserva.cliente_id,
+                    'sucursal_id': reserva.sucursal_id
+                })
+            db.session.delete(reserva)
+        
         print("Eliminando cliente...")
+        registrar_evento('cliente', cliente.id, 'eliminado')
         db.session.delete(cliente)
-        db.session.commit()
+        db.session.flush()
+        
+        asignadas = []
+        for libro_id, sucursal_id in libros_liberados:
+            asignadas.extend(asignar_reservas(libro_id, sucursal_id))
+        confirmar_asignaciones(asignadas)
         print("Cliente eliminado exitosamente")
         
         return "", 204
@@ -464,24 +944,50 @@ def update_cliente(cliente_id):
 def add_prestamo():
     try:
         data = request.get_json()
+        sucursal_id = data.get('sucursal_id')
+        
+        # Con sucursal solo se bloquea su fila de ejemplares; las demás sucursales siguen libres
+        inventario = bloquear_inventario(data.get('libro_id'), sucursal_id)
         
         libro = Book.query.get_or_404(data.get('libro_id'))
         cliente = Cliente.query.get_or_404(data.get('cliente_id'))
         
-        disponibilidad_real = get_real_availability(libro.id)
+        if sucursal_id is not None:
+            if not inventario:
+                return jsonify({'message': 'El libro no tiene ejemplares en esta sucursal'}), 400
+        
+        elif Ejemplar.query.filter_by(libro_id=libro.id).first():
+            return jsonify({'message': 'Este libro se presta por sucursal; indique sucursal_id'}), 400
+        
+        # Libera reservas vencidas antes de decidir; se confirma aunque el préstamo se rechace
+        asignadas = asignar_reservas(libro.id, sucursal_id)
+        
+        # Una reserva sin sucursal (anterior a los ejemplares por sucursal) se retira en cualquiera
+        reserva = Reserva.query.filter(
+            Reserva.libro_id == libro.id,
+            Reserva.cliente_id == cliente.id,
+            db.or_(Reserva.sucursal_id == sucursal_id, Reserva.sucursal_id.is_(None)),
+            Reserva.estado == 'asignada'
+        ).with_for_update().first()
         
-        if disponibilidad_real < 1:
+        disponibilidad_real = get_real_availability(libro.id, sucursal_id, bloquear=True)
+        
+        if not reserva and disponibilidad_real < 1:
+            confirmar_asignaciones(asignadas)
             return jsonify({
-                'message': 'No hay ejemplares disponibles de este libro',
+                'message': 'No hay ejemplares disponibles de este libro. Puede registrar una reserva',
                 'disponibles': disponibilidad_real
             }), 400
             
+        # El cliente puede pedir otro libro en paralelo: se serializa por su fila
+        db.session.refresh(cliente, with_for_update=True)
         prestamo_activo = Prestamo.query.filter_by(
             cliente_id=cliente.id,
             estado='activo'
         ).first()
         
         if prestamo_activo:
+            confirmar_asignaciones(asignadas)
             return jsonify({
                 'message': 'El cliente ya tiene un libro prestado',
                 'libro': prestamo_activo.libro.titulo
@@ -493,12 +999,24 @@ def add_prestamo():
             libro_id=libro.id,
             cliente_id=cliente.id,
             usuario_id=request.headers.get('X-User-ID'),
+            sucursal_id=sucursal_id,
             fecha_devolucion_esperada=fecha_devolucion,
             estado='activo'
         )
         
         db.session.add(new_prestamo)
-        db.session.commit()
+        
+        if reserva:
+            reserva.estado = 'completada'
+        
+        db.session.flush()
+        registrar_evento('prestamo', new_prestamo.id, 'creado', {
+            'libro_id': new_prestamo.libro_id,
+            'cliente_id': new_prestamo.cliente_id,
+            'sucursal_id': new_prestamo.sucursal_id,
+            'estado': new_prestamo.estado
+        })
+        confirmar_asignaciones(asignadas)
         
         return prestamo_schema.dump(new_prestamo), 201
         
@@ -512,13 +1030,24 @@ def devolver_prestamo(prestamo_id):
     try:
         prestamo = Prestamo.query.get_or_404(prestamo_id)
         
+        bloquear_inventario(prestamo.libro_id, prestamo.sucursal_id)
+        db.session.refresh(prestamo, with_for_update=True)
+        
         if prestamo.estado != 'activo':
             return jsonify({'message': 'Este préstamo ya fue devuelto'}), 400
             
         prestamo.fecha_devolucion_real = datetime.now()
         prestamo.estado = 'devuelto'
         
-        db.session.commit()
+        registrar_evento('prestamo', prestamo.id, 'devuelto', {
+            'libro_id': prestamo.libro_id,
+            'cliente_id': prestamo.cliente_id,
+            'sucursal_id': prestamo.sucursal_id,
+            'estado': prestamo.estado
+        })
+        
+        asignadas = asignar_reservas(prestamo.libro_id, prestamo.sucursal_id)
+        confirmar_asignaciones(asignadas)
         
         return prestamo_schema.dump(prestamo), 200
         
@@ -529,9 +1058,150 @@ def devolver_prestamo(prestamo_id):
 @prestamos_bp.route("/", methods=["GET"])
 def get_prestamos():
     estado = request.args.get('estado', 'activo')
-    prestamos = Prestamo.query.filter_by(estado=estado).all()
+    query = Prestamo.query.filter_by(estado=estado)
+    
+    sucursal_id = request.args.get('sucursal', type=int)
+    if sucursal_id:
+        query = query.filter_by(sucursal_id=sucursal_id)
+    
+    prestamos = query.all()
     return prestamos_schema.dump(prestamos), 200
 
+# -------- Rutas de Reservas --------
+@reservas_bp.route("/", methods=["POST"])
+@manager_or_admin_required
+def add_reserva():
+    data = request.get_json()
+    libro = Book.query.get_or_404(data.get('libro_id'))
+    cliente = Cliente.query.get_or_404(data.get('cliente_id'))
+    sucursal_id = data.get('sucursal_id')
+    if sucursal_id is not None:
+        sucursal_id = Sucursal.query.get_or_404(sucursal_id).id
+    
+    try:
+        bloquear_inventario(libro.id, sucursal_id)
+        
+        if sucursal_id is None and Ejemplar.query.filter_by(libro_id=libro.id).first():
+            return jsonify({'message': 'Este libro se reserva por sucursal; indique sucursal_id'}), 400
+        
+        # Otra sucursal del mismo libro no comparte el bloqueo: se serializa por el cliente
+        db.session.refresh(cliente, with_for_update=True)
+        reserva_existente = Reserva.query.filter(
+            Reserva.libro_id == libro.id,
+            Reserva.cliente_id == cliente.id,
+            Reserva.estado.in_(['pendiente', 'asignada'])
+        ).first()
+        
+        if reserva_existente:
+            return jsonify({'message': 'El cliente ya tiene una reserva de este libro'}), 400
+        
+        asignadas = asignar_reservas(libro.id, sucursal_id)
+        
+        if get_real_availability(libro.id, sucursal_id, bloquear=True) > 0:
+            confirmar_asignaciones(asignadas)
+            return jsonify({'message': 'Hay ejemplares disponibles, registre el préstamo directamente'}), 400
+        
+        new_reserva = Reserva(
+            libro_id=libro.id,
+            cliente_id=cliente.id,
+            usuario_id=request.headers.get('X-User-ID'),
+            sucursal_id=sucursal_id,
+            estado='pendiente'
+        )
+        
+        db.session.add(new_reserva)
+        db.session.flush()
+        registrar_evento('reserva', new_reserva.id, 'creada', {
+            'libro_id': new_reserva.libro_id,
+            'cliente_id': new_reserva.cliente_id,
+            'sucursal_id': new_reserva.sucursal_id
+        })
+        
+        # Un ejemplar pudo liberarse desde la verificación de disponibilidad
+        asignadas.extend(asignar_reservas(libro.id, sucursal_id))
+        confirmar_asignaciones(asignadas)
+        
+        reserva_data = reserva_schema.dump(new_reserva)
+        reserva_data['posicion'] = 0 if new_reserva.estado == 'asignada' else Reserva.query.filter(
+            Reserva.libro_id == libro.id,
+            Reserva.sucursal_id == sucursal_id,
+            Reserva.estado == 'pendiente',
+            Reserva.id <= new_reserva.id
+        ).count()
+        return jsonify(reserva_data), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': 'Error al registrar reserva', 'error': str(e)}), 500
+
+@reservas_bp.route("/", methods=["GET"])
+def get_reservas():
+    query = Reserva.query.filter_by(estado=request.args.get('estado', 'pendiente'))
+    
+    libro_id = request.args.get('libro_id', type=int)
+    if libro_id:
+        query = query.filter_by(libro_id=libro_id)
+    
+    sucursal_id = request.args.get('sucursal', type=int)
+    if sucursal_id:
+        query = query.filter_by(sucursal_id=sucursal_id)
+    
+    return reservas_schema.dump(query.order_by(Reserva.id).all()), 200
+
+@reservas_bp.route("/vencidas", methods=["POST"])
+@manager_or_admin_required
+def procesar_reservas_vencidas():
+    """Libera las reservas no retiradas a tiempo y pasa los ejemplares a la siguiente reserva"""
+    try:
+        limite = datetime.now() - timedelta(days=current_app.config.get('RESERVA_DIAS_RETIRO', 3))
+        
+        pendientes = db.session.query(Reserva.libro_id, Reserva.sucursal_id).filter(
+            Reserva.estado == 'asignada',
+            Reserva.fecha_asignacion < limite
+        ).distinct().all()
+        
+        asignadas = []
+        for libro_id, sucursal_id in pendientes:
+            asignadas.extend(asignar_reservas(libro_id, sucursal_id))
+        confirmar_asignaciones(asignadas)
+        
+        return jsonify({
+            'libros': len(pendientes),
+            'asignadas': [reserva.id for reserva in asignadas]
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': 'Error al procesar reservas vencidas', 'error': str(e)}), 500
+
+@reservas_bp.route("/<int:reserva_id>", methods=["DELETE"])
+@manager_or_admin_required
+def cancelar_reserva(reserva_id):
+    reserva = Reserva.query.get_or_404(reserva_id)
+    
+    try:
+        bloquear_inventario(reserva.libro_id, reserva.sucursal_id)
+        db.session.refresh(reserva, with_for_update=True)
+        
+        if reserva.estado not in ['pendiente', 'asignada']:
+            return jsonify({'message': 'Esta reserva ya no está vigente'}), 400
+        
+        reserva.estado = 'cancelada'
+        registrar_evento('reserva', reserva.id, 'cancelada', {
+            'libro_id': reserva.libro_id,
+            'cliente_id': reserva.cliente_id,
+            'sucursal_id': reserva.sucursal_id
+        })
+        
+        asignadas = asignar_reservas(reserva.libro_id, reserva.sucursal_id)
+        confirmar_asignaciones(asignadas)
+        
+        return "", 204
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': 'Error al cancelar reserva', 'error': str(e)}), 500
+
 # -------- Rutas de Reportes --------
 @reportes_bp.route("/prestamos", methods=["GET"])
 @admin_required
@@ -577,4 +1247,48 @@ def get_prestamos_activos_libro(book_id):
         
         return jsonify(prestamos_schema.dump(prestamos_activos)), 200
     except Exception as e:
-        return jsonify({'message': 'Error al obtener préstamos activos', 'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'message': 'Error al obtener préstamos activos', 'error': str(e)}), 500
+
+# -------- Rutas de Eventos --------
+@eventos_bp.route("/", methods=["GET"])
+def get_eventos():
+    """Devuelve los eventos posteriores a `since`; con `wait` espera (long-poll) hasta que haya alguno"""
+    try:
+        since = request.args.get('since', 0, type=int)
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 500)
+        wait = min(max(request.args.get('wait', 0, type=int), 0), 30)
+        espera_hueco = timedelta(seconds=current_app.config.get('EVENTOS_ESPERA_HUECO', 10))
+        
+        deadline = time.monotonic() + wait
+        while True:
+            candidatos = Evento.query.filter(
+                Evento.id > since
+            ).order_by(Evento.id).limit(limit).all()
+            ahora = db.session.query(db.func.current_timestamp()).scalar()
+            
+            # Los ids se asignan al insertar, no al confirmar: un hueco en la secuencia puede
+            # ser una transacción aún abierta. Solo se entregan eventos hasta el primer hueco,
+            # salvo que el evento posterior al hueco sea más antiguo que `espera_hueco`
+            # (para entonces la transacción ya terminó o se revirtió).
+            eventos = []
+            esperado = since + 1
+            for evento in candidatos:
+                if evento.id != esperado and evento.created_at > ahora - espera_hueco:
+                    break
+                eventos.append(evento)
+                esperado = evento.id + 1
+            
+            if eventos or time.monotonic() >= deadline:
+                break
+            
+            # Cierra la transacción para ver los eventos confirmados por otras peticiones
+            db.session.rollback()
+            time.sleep(1)
+        
+        return jsonify({
+            'eventos': eventos_schema.dump(eventos),
+            'ultimo': eventos[-1].id if eventos else since
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'message': 'Error al obtener eventos', 'error': str(e)}), 500
\ No newline at end of file
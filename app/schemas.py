@@ -1,5 +1,5 @@
 from flask_marshmallow import Marshmallow
-from app.models import User, Role, Book, Cliente, Prestamo
+from app.models import User, Role, Book, Sucursal, Cliente, Prestamo, Reserva, Evento
 
 ma = Marshmallow()
 
@@ -41,6 +41,14 @@ class BookSchema(ma.SQLAlchemyAutoSchema):
 book_schema = BookSchema()
 books_schema = BookSchema(many=True)
 
+class SucursalSchema(ma.SQLAlchemyAutoSchema):
+    class Meta:
+        model = Sucursal
+        load_instance = True
+        
+sucursal_schema = SucursalSchema()
+sucursales_schema = SucursalSchema(many=True)
+
 class ClienteSchema(ma.SQLAlchemyAutoSchema):
     class Meta:
         model = Cliente
@@ -62,4 +70,25 @@ class PrestamoSchema(ma.SQLAlchemyAutoSchema):
         include_fk = True
         
 prestamo_schema = PrestamoSchema()
-prestamos_schema = PrestamoSchema(many=True)
\ No newline at end of file
+prestamos_schema = PrestamoSchema(many=True)
+
+
+class ReservaSchema(ma.SQLAlchemyAutoSchema):
+    libro = ma.Nested(BookSchema) # pylint: disable=no-member
+    cliente = ma.Nested(ClienteSchema) # pylint: disable=no-member
+    
+    class Meta:
+        model = Reserva
+        load_instance = True
+        include_fk = True
+        
+reserva_schema = ReservaSchema()
+reservas_schema = ReservaSchema(many=True)
+
+
+class EventoSchema(ma.SQLAlchemyAutoSchema):
+    class Meta:
+        model = Evento
+        load_instance = True
+        
+eventos_schema = EventoSchema(many=True)
\ No newline at end of file
@@ -0,0 +1,37 @@
+"""Microbenchmark del limitador: costo por solicitud con y sin la verificación"""
+import timeit
+from app import create_app
+from app.ratelimit import MemoryBackend
+
+def bench_backend(n=200000):
+    backend = MemoryBackend()
+    keys = [f"books:u{i}" for i in range(1000)]
+    total = timeit.timeit(
+        lambda: [backend.consume(k, 10**9, 60) for k in keys],
+        number=n // len(keys)
+    )
+    print(f"MemoryBackend.consume: {total / n * 1e6:.2f} us/llamada")
+
+def bench_request(n=2000, rondas=7):
+    app = create_app()
+    app.add_url_rule("/bench", "bench", lambda: "ok")
+    limitada = app.extensions['ratelimit']
+    client = app.test_client()
+    timeit.timeit(lambda: client.get("/bench"), number=n)
+    
+    # Rondas alternadas; el mínimo de cada caso descarta el ruido del sistema
+    con, sin = [], []
+    for _ in range(rondas):
+        limitada.limits["bench"] = (10**9, 60)
+        con.append(timeit.timeit(lambda: client.get("/bench", headers={'X-User-ID': '1'}), number=n))
+        del limitada.limits["bench"]
+        sin.append(timeit.timeit(lambda: client.get("/bench", headers={'X-User-ID': '1'}), number=n))
+    con, sin = min(con), min(sin)
+    
+    print(f"Solicitud sin límite: {sin / n * 1e6:.1f} us")
+    print(f"Solicitud con límite: {con / n * 1e6:.1f} us")
+    print(f"Sobrecosto:           {(con - sin) / n * 1e6:.1f} us")
+
+if __name__ == "__main__":
+    bench_backend()
+    bench_request()
@@ -0,0 +1,10 @@
+-- Outbox de eventos de cambio (préstamos e inventario)
+CREATE TABLE IF NOT EXISTS eventos (
+    id         INT NOT NULL AUTO_INCREMENT,
+    entidad    VARCHAR(20) NOT NULL,
+    entidad_id INT NOT NULL,
+    accion     VARCHAR(20) NOT NULL,
+    datos      JSON NULL,
+    created_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id)
+) ENGINE=InnoDB;
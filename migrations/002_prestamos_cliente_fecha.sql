@@ -0,0 +1,2 @@
+-- Historial de préstamos por cliente (GET /clientes/<id>/prestamos y /resumen)
+CREATE INDEX ix_prestamos_cliente_fecha ON prestamos (cliente_id, fecha_prestamo);
@@ -0,0 +1,15 @@
+-- Cola de reservas por libro
+CREATE TABLE IF NOT EXISTS reservas (
+    id               INT NOT NULL AUTO_INCREMENT,
+    libro_id         INT NOT NULL,
+    cliente_id       INT NOT NULL,
+    usuario_id       INT NOT NULL,
+    estado           VARCHAR(20) NOT NULL DEFAULT 'pendiente',
+    fecha_asignacion TIMESTAMP NULL,
+    created_at       TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id),
+    KEY ix_reservas_libro_estado (libro_id, estado, id),
+    CONSTRAINT fk_reservas_libro FOREIGN KEY (libro_id) REFERENCES libros (id),
+    CONSTRAINT fk_reservas_cliente FOREIGN KEY (cliente_id) REFERENCES clientes (id),
+    CONSTRAINT fk_reservas_usuario FOREIGN KEY (usuario_id) REFERENCES users (id)
+) ENGINE=InnoDB;
@@ -0,0 +1,31 @@
+-- Inventario por sucursal
+CREATE TABLE IF NOT EXISTS sucursales (
+    id         INT NOT NULL AUTO_INCREMENT,
+    nombre     VARCHAR(100) NOT NULL,
+    direccion  VARCHAR(255) NULL,
+    created_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id),
+    UNIQUE KEY uq_sucursales_nombre (nombre)
+) ENGINE=InnoDB;
+
+CREATE TABLE IF NOT EXISTS ejemplares (
+    id          INT NOT NULL AUTO_INCREMENT,
+    libro_id    INT NOT NULL,
+    sucursal_id INT NOT NULL,
+    cantidad    INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (id),
+    UNIQUE KEY uq_ejemplares_libro_sucursal (libro_id, sucursal_id),
+    KEY ix_ejemplares_sucursal_libro (sucursal_id, libro_id),
+    CONSTRAINT fk_ejemplares_libro FOREIGN KEY (libro_id) REFERENCES libros (id),
+    CONSTRAINT fk_ejemplares_sucursal FOREIGN KEY (sucursal_id) REFERENCES sucursales (id)
+) ENGINE=InnoDB;
+
+-- Préstamos y reservas existentes quedan sin sucursal (NULL)
+ALTER TABLE prestamos
+    ADD COLUMN sucursal_id INT NULL AFTER usuario_id,
+    ADD KEY ix_prestamos_sucursal_estado (sucursal_id, estado, libro_id),
+    ADD CONSTRAINT fk_prestamos_sucursal FOREIGN KEY (sucursal_id) REFERENCES sucursales (id);
+
+ALTER TABLE reservas
+    ADD COLUMN sucursal_id INT NULL AFTER usuario_id,
+    ADD CONSTRAINT fk_reservas_sucursal FOREIGN KEY (sucursal_id) REFERENCES sucursales (id);